@@ -1,49 +1,119 @@
-from flask import Flask, render_template, jsonify
-from internet_monitor import InternetMonitor
+from flask import Flask, render_template
+import orjson
+from internet_monitor import InternetMonitor, AdaptiveInterval, shutdown_executors
+import atexit
+import os
 import threading
 import time
 
 app = Flask(__name__)
 monitor = InternetMonitor()
 
-# Кешируем результаты на 5 секунд для уменьшения нагрузки
-cached_stats = {}
-cache_lock = threading.Lock()
-cache_time = 0
-CACHE_TTL = 5  # секунд
+UPDATE_INTERVAL = 10  # секунд, начальный интервал; дальше подстраивается
+stop_event = threading.Event()
+poll_interval = AdaptiveInterval(initial=UPDATE_INTERVAL)
+
+LOG_FILE = 'internet_events.log'
+LOG_TAIL_LINES = 50
+LOG_BLOCK_SIZE = 4096
+MAX_TAIL_BYTES = 64 * 1024  # Ограничение ответа /api/logs даже при очень длинных строках
+
+def collect_stats():
+    monitor.refresh_external_info()  # Сам пропускает обновление, если данные свежие
+    return monitor.get_all_stats()
+
+# Кеш статистики: снимок собирается целиком и публикуется одним присваиванием
+# (атомарно под GIL), поэтому блокировка для чтения не нужна.
+# Первый снимок собираем синхронно, чтобы /api/stats сразу отдавал полные данные
+cached_stats = collect_stats()
+publish_lock = threading.Lock()  # Только для писателей: фоновый поток и /api/speedtest
 
 def update_cache():
-    global cached_stats, cache_time
+    global cached_stats
+    # Интервал отсчитывается от начала цикла, чтобы долгий сбор не сдвигал расписание
+    new_stats = cached_stats
+    deadline = time.monotonic()
     while True:
-        with cache_lock:
-            cached_stats = monitor.get_all_stats()
-            cache_time = time.time()
-        time.sleep(10)  # Обновление каждые 10 секунд
+        deadline += poll_interval.update(new_stats)
+        now = time.monotonic()
+        if deadline < now:
+            # Сбор занял больше интервала — не пытаемся наверстать пропущенные циклы
+            deadline = now
+        if stop_event.wait(deadline - now):
+            break
+        try:
+            new_stats = collect_stats()
+        except RuntimeError:
+            # Пулы остановлены во время сбора — приложение завершается
+            if stop_event.is_set():
+                break
+            raise
+        with publish_lock:
+            # Скорость берём в момент публикации: внеплановый замер мог завершиться во время сбора
+            cached_stats = {**new_stats, 'speed': dict(monitor.last_speed)}
 
 # Запускаем фоновый поток для обновления кеша
 update_thread = threading.Thread(target=update_cache, daemon=True)
 update_thread.start()
 
+def shutdown():
+    # Останавливаем цикл обновления и сбрасываем ещё не начатые задачи сбора
+    stop_event.set()
+    shutdown_executors()
+
+atexit.register(shutdown)
+
+def json_response(data):
+    # orjson сериализует заметно быстрее стандартного json в jsonify
+    return app.response_class(orjson.dumps(data), mimetype='application/json')
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/api/stats')
 def get_stats():
-    with cache_lock:
-        # Если кеш устарел, обновляем его
-        if time.time() - cache_time > CACHE_TTL:
-            cached_stats = monitor.get_all_stats()
-        return jsonify(cached_stats)
+    # Сбор статистики идёт только в фоновом потоке, здесь отдаём последний снимок
+    return json_response(cached_stats)
+
+@app.route('/api/speedtest', methods=['POST'])
+def run_speedtest():
+    global cached_stats
+    # Внеплановый замер скорости по запросу пользователя
+    result = monitor.run_speedtest()
+    # Сразу публикуем новый замер, не дожидаясь следующего цикла обновления
+    with publish_lock:
+        cached_stats = {**cached_stats, 'speed': dict(monitor.last_speed)}
+    return json_response(result)
+
+def tail_file(path, lines=LOG_TAIL_LINES):
+    """Чтение последних строк файла блоками с конца, без загрузки всего файла"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        remaining = f.tell()
+        buf = b''
+        # Нужна одна лишняя строка, чтобы первая из возвращаемых была целой
+        while remaining > 0 and buf.count(b'\n') <= lines and len(buf) < MAX_TAIL_BYTES:
+            block = min(LOG_BLOCK_SIZE, remaining)
+            remaining -= block
+            f.seek(remaining)
+            buf = f.read(block) + buf
+    buf = buf[-MAX_TAIL_BYTES:]
+    return [line.decode('utf-8', errors='replace')
+            for line in buf.splitlines(keepends=True)[-lines:]]
 
 @app.route('/api/logs')
 def get_logs():
     try:
-        with open('internet_events.log', 'r', encoding='utf-8') as f:
-            lines = f.readlines()[-50:]  # Последние 50 строк
-        return jsonify({'logs': lines})
+        lines = tail_file(LOG_FILE)  # Последние 50 строк
+        return json_response({'logs': lines})
     except FileNotFoundError:
-        return jsonify({'logs': []})
+        return json_response({'logs': []})
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+    try:
+        app.run(host='0.0.0.0', port=5000, debug=False)
+    finally:
+        # atexit срабатывает уже после ожидания рабочих потоков пулов, поэтому
+        # при остановке сервера пулы гасим сразу
+        shutdown()
\ No newline at end of file
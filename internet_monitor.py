@@ -2,24 +2,119 @@ import socket
 import time
 import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
 from datetime import datetime
 import psutil
 import netifaces
 import requests
-import speedtest
+from requests.adapters import HTTPAdapter
 import subprocess
 import json
 from typing import Dict, Any, Optional, Tuple
 
+# Общий пул для параллельного сбора статистик (I/O-bound задачи)
+_executor = ThreadPoolExecutor(max_workers=5, thread_name_prefix='monitor')
+COLLECT_TIMEOUT = 20  # секунд на каждый сборщик
+HTTP_TIMEOUT = (2, 5)  # секунд: (подключение, чтение)
+EXTERNAL_INFO_TIMEOUT = (2, 4)
+EXTERNAL_INFO_TTL = 3600  # секунд; внешний IP и провайдер меняются редко
+EXTERNAL_INFO_RETRY = 300  # секунд до повторной попытки после ошибки
+SPEEDTEST_INTERVAL = 300  # секунд между плановыми замерами скорости
+SPEEDTEST_RETRY = 60  # секунд до повторного замера после неудачного
+SPEEDTEST_DOWNLOAD_URL = 'https://speed.cloudflare.com/__down'
+SPEEDTEST_UPLOAD_URL = 'https://speed.cloudflare.com/__up'
+SPEEDTEST_DOWNLOAD_BYTES = 10 * 1024 * 1024
+SPEEDTEST_UPLOAD_BYTES = 2 * 1024 * 1024
+SPEEDTEST_CHUNK_SIZE = 65536
+SPEEDTEST_MAX_DURATION = 4  # секунд на загрузку и на отдачу, дальше считаем по переданному объёму
+# Ожидание замера: загрузка и отдача плюс запас на подключение и первый байт
+SPEEDTEST_TIMEOUT = 2 * SPEEDTEST_MAX_DURATION + 4  # секунд
+NET_INFO_TTL = 60  # секунд кеширования данных сетевого интерфейса
+CONN_CACHE_TTL = 5  # секунд кеширования списка сетевых процессов
+MAX_PROCESSES = 20
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+TEST_URLS = (
+    "https://www.google.com",
+    "https://www.cloudflare.com",
+    "https://1.1.1.1"
+)
+
+# Отдельный пул для одновременных проверок доступности. Уже начатый запрос
+# отменить нельзя: проверка недоступного адреса держит поток до HTTP_TIMEOUT
+# (до 7 с), а цикл опроса бывает короче (от 2 с). Поэтому пул рассчитан на
+# PROBE_ROUNDS циклов одновременно, чтобы новые проверки не ждали старые
+PROBE_ROUNDS = 5
+_probe_executor = ThreadPoolExecutor(max_workers=len(TEST_URLS) * PROBE_ROUNDS,
+                                     thread_name_prefix='probe')
+
+def shutdown_executors():
+    """Остановка пулов: задачи в очереди отменяются, уже идущие дорабатывают до своих таймаутов"""
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _probe_executor.shutdown(wait=False, cancel_futures=True)
+
+class AdaptiveInterval:
+    """
+    Адаптивный интервал опроса: увеличивается, пока состояние сети стабильно,
+    и сокращается при изменениях (доступность, внешний IP, активный интерфейс).
+    Скорость трафика не учитывается: в неё входят собственные проверки монитора,
+    объём которых в секунду зависит от самого интервала
+    """
+    MIN_INTERVAL = 2    # секунд
+    MAX_INTERVAL = 60   # секунд
+    STABLE_CYCLES = 3
+
+    def __init__(self, initial: float = 10):
+        self.interval = initial
+        self._state = None
+        self._stable_cycles = 0
+
+    def update(self, stats: Dict[str, Any]) -> float:
+        """Учитывает новый снимок статистики и возвращает следующий интервал"""
+        network_info = stats.get('network_info', {})
+        state = (
+            stats.get('availability', {}).get('available'),
+            network_info.get('external_ip'),
+            network_info.get('interface_name'),
+            network_info.get('local_ip')
+        )
+        changed = self._state is not None and state != self._state
+        self._state = state
+
+        if changed:
+            self.interval = max(self.MIN_INTERVAL, self.interval / 2)
+            self._stable_cycles = 0
+        else:
+            self._stable_cycles += 1
+            if self._stable_cycles >= self.STABLE_CYCLES:
+                self.interval = min(self.MAX_INTERVAL, self.interval * 2)
+                self._stable_cycles = 0
+
+        return self.interval
+
 class InternetMonitor:
     def __init__(self):
         self.logger = self._setup_logger()
         self.last_down_time = None
+        self.last_down_text = 'Never'
         self.traffic_stats = {'sent': 0, 'recv': 0}
         self._init_traffic_baseline()
+        self.session = self._setup_session()
+        self.hostname = socket.gethostname()
+        self._net_info_cache = None
+        self._net_info_ts = 0
+        self._conn_cache = []
+        self._conn_cache_ts = None
+        self.last_speed = {'download': None, 'upload': None}
+        self.last_speed_ts = None
+        self._speed_attempt_ts = None
+        self._speed_lock = threading.Lock()
         self.external_ip = "N/A"
         self.provider = "N/A"
-        self._update_external_info()
+        # Внешний IP обновляется фоновым потоком через refresh_external_info()
+        self._external_info_due = None  # monotonic-время следующего обновления
+        self._last_available = True
 
     def _setup_logger(self):
         logger = logging.getLogger('InternetMonitor')
@@ -30,81 +125,182 @@ class InternetMonitor:
         logger.addHandler(handler)
         return logger
 
+    def _setup_session(self) -> requests.Session:
+        """HTTP-сессия с пулом соединений и keep-alive для повторных проверок"""
+        session = requests.Session()
+        session.headers['User-Agent'] = 'InternetMonitor/1.0'
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
     def _init_traffic_baseline(self):
         """Инициализация базовых значений трафика"""
         net_io = psutil.net_io_counters()
         self.traffic_stats['sent'] = net_io.bytes_sent
         self.traffic_stats['recv'] = net_io.bytes_recv
+        self.traffic_ts = time.monotonic()
 
-    def check_internet_availability(self, timeout=5) -> Dict[str, Any]:
+    def _probe(self, url: str, timeout) -> Tuple[requests.Response, float]:
+        """Один HTTP-запрос проверки доступности; возвращает ответ и время в мс"""
+        start = time.time()
+        response = self.session.get(url, timeout=timeout)
+        return response, (time.time() - start) * 1000
+
+    def check_internet_availability(self, timeout=HTTP_TIMEOUT) -> Dict[str, Any]:
         """
         Проверка доступности интернета с обработкой ошибок HTTP
         Возвращает словарь с результатами проверки
         """
-        test_urls = [
-            "https://www.google.com",
-            "https://www.cloudflare.com",
-            "https://1.1.1.1"
-        ]
-        
-        for url in test_urls:
-            try:
-                start = time.time()
-                response = requests.get(url, timeout=timeout, 
-                                     headers={'User-Agent': 'InternetMonitor/1.0'})
-                ping_ms = (time.time() - start) * 1000
-                
-                # Логируем ошибки 4xx/5xx
-                if response.status_code >= 400:
-                    self.logger.warning(f"HTTP Error {response.status_code} for {url}")
-                    
-                return {
+        # Все адреса проверяем одновременно и берём первый успешный ответ
+        futures = {
+            _probe_executor.submit(self._probe, url, timeout): url
+            for url in TEST_URLS
+        }
+        error_result = None
+        try:
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    response, ping_ms = future.result()
+                except requests.exceptions.ConnectionError:
+                    continue
+                except requests.exceptions.Timeout:
+                    continue
+                except requests.exceptions.RequestException as e:
+                    self.logger.error(f"Request exception: {e}")
+                    continue
+
+                result = {
                     'available': 200 <= response.status_code < 400,
                     'status_code': response.status_code,
                     'ping': round(ping_ms, 2),
                     'test_url': url
                 }
-                
-            except requests.exceptions.ConnectionError:
-                continue
-            except requests.exceptions.Timeout:
-                continue
-            except requests.exceptions.RequestException as e:
-                self.logger.error(f"Request exception: {e}")
-                continue
+                if result['available']:
+                    return result
+
+                # Логируем ошибки 4xx/5xx
+                if response.status_code >= 400:
+                    self.logger.warning(f"HTTP Error {response.status_code} for {url}")
+                if error_result is None:
+                    error_result = result
+        finally:
+            # Отменяем ещё не начатые проверки; уже идущие завершатся сами по таймауту
+            for future in futures:
+                future.cancel()
+
+        # Сервер ответил, но с ошибкой HTTP
+        if error_result is not None:
+            return error_result
         
         # Если все проверки провалились
         if self.last_down_time is None:
             self.last_down_time = datetime.now()
+            self.last_down_text = self.last_down_time.strftime(TIMESTAMP_FORMAT)
             self.logger.critical("INTERNET DOWN - Initial detection")
         return {'available': False, 'status_code': 0, 'ping': None, 'test_url': None}
 
     def measure_speed(self) -> Dict[str, Optional[float]]:
         """
-        Измерение скорости интернета в отдельном потоке
+        Измерение скорости интернета загрузкой и отправкой тестовых данных по HTTP
         """
         result = {'download': None, 'upload': None}
         try:
-            st = speedtest.Speedtest(timeout=5)
-            st.get_best_server()
-            result['download'] = st.download() / 1_000_000  # Мбит/с
-            result['upload'] = st.upload() / 1_000_000      # Мбит/с
+            result['download'] = self._measure_download()  # Мбит/с
+            result['upload'] = self._measure_upload()      # Мбит/с
         except Exception as e:
             self.logger.error(f"Speedtest failed: {e}")
         return result
 
+    def _measure_download(self) -> float:
+        """Скорость загрузки в Мбит/с; чтение прерывается по SPEEDTEST_MAX_DURATION"""
+        received = 0
+        with self.session.get(SPEEDTEST_DOWNLOAD_URL,
+                              params={'bytes': SPEEDTEST_DOWNLOAD_BYTES},
+                              stream=True, timeout=HTTP_TIMEOUT) as response:
+            response.raise_for_status()
+            start = time.monotonic()
+            for chunk in response.iter_content(SPEEDTEST_CHUNK_SIZE):
+                received += len(chunk)
+                if time.monotonic() - start > SPEEDTEST_MAX_DURATION:
+                    break
+            elapsed = time.monotonic() - start
+        return received * 8 / max(elapsed, 1e-3) / 1_000_000
+
+    def _measure_upload(self) -> float:
+        """Скорость отдачи в Мбит/с; отправка прерывается по SPEEDTEST_MAX_DURATION"""
+        chunk = bytes(SPEEDTEST_CHUNK_SIZE)
+        sent = 0
+        start = end = None
+
+        def body():
+            nonlocal sent, start, end
+            # Отсчёт с первого блока тела, как и у загрузки: без подключения и TLS
+            start = time.monotonic()
+            while (sent < SPEEDTEST_UPLOAD_BYTES
+                   and time.monotonic() - start <= SPEEDTEST_MAX_DURATION):
+                yield chunk
+                sent += len(chunk)
+            end = time.monotonic()
+
+        response = self.session.post(SPEEDTEST_UPLOAD_URL, data=body(), timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        return sent * 8 / max(end - start, 1e-3) / 1_000_000
+
+    def run_speedtest(self) -> Dict[str, Optional[float]]:
+        """
+        Замер скорости с сохранением результата. Если замер уже идёт,
+        новый не запускается: дожидаемся текущего и отдаём его результат
+        """
+        if not self._speed_lock.acquire(blocking=False):
+            with self._speed_lock:
+                return dict(self.last_speed)
+        try:
+            self._speed_attempt_ts = time.monotonic()
+            result = self.measure_speed()
+            # Неудачный замер не затирает последний успешный
+            if result['download'] is not None and result['upload'] is not None:
+                self.last_speed = result
+                self.last_speed_ts = time.monotonic()
+        finally:
+            self._speed_lock.release()
+        return result
+
+    def _speedtest_due(self) -> bool:
+        now = time.monotonic()
+        if self._speed_lock.locked():
+            return False
+        if self._speed_attempt_ts is not None and now - self._speed_attempt_ts < SPEEDTEST_RETRY:
+            return False
+        return self.last_speed_ts is None or now - self.last_speed_ts > SPEEDTEST_INTERVAL
+
     def get_network_info(self) -> Dict[str, Any]:
         """
         Сбор всей сетевой информации
         """
         info = {
-            'hostname': socket.gethostname(),
-            'local_ip': 'N/A',
-            'mac_address': 'N/A',
-            'interface_name': 'N/A',
+            'hostname': self.hostname,
             'external_ip': self.external_ip,
             'provider': self.provider
         }
+        info.update(self._get_interface_info())
+        return info
+
+    def _get_interface_info(self) -> Dict[str, str]:
+        """
+        Данные активного интерфейса; интерфейсы меняются редко,
+        поэтому результат кешируется на NET_INFO_TTL секунд
+        """
+        now = time.monotonic()
+        if self._net_info_cache is not None and now - self._net_info_ts < NET_INFO_TTL:
+            return self._net_info_cache
+
+        info = {
+            'local_ip': 'N/A',
+            'mac_address': 'N/A',
+            'interface_name': 'N/A'
+        }
         
         # Получаем активные интерфейсы
         try:
@@ -118,8 +314,12 @@ class InternetMonitor:
                         info['mac_address'] = addrs[netifaces.AF_LINK][0]['addr']
                     break
         except Exception as e:
+            # Ошибку не кешируем, повторим при следующем вызове
             self.logger.error(f"Network info error: {e}")
-            
+            return info
+
+        self._net_info_cache = info
+        self._net_info_ts = now
         return info
 
     def get_traffic_usage(self) -> Dict[str, Any]:
@@ -127,6 +327,8 @@ class InternetMonitor:
         Сбор статистики по использованию трафика
         """
         net_io = psutil.net_io_counters()
+        now = time.monotonic()
+        dt = max(1e-3, now - self.traffic_ts)  # Реальный интервал с прошлого замера
         current_sent = net_io.bytes_sent
         current_recv = net_io.bytes_recv
         
@@ -136,79 +338,142 @@ class InternetMonitor:
         # Обновляем базовые значения
         self.traffic_stats['sent'] = current_sent
         self.traffic_stats['recv'] = current_recv
+        self.traffic_ts = now
         
         return {
             'sent_total_mb': round(current_sent / 1_048_576, 2),
             'recv_total_mb': round(current_recv / 1_048_576, 2),
-            'sent_rate_kbps': round(sent_diff * 8 / 1024 / 10, 2),  # за 10 секунд
-            'recv_rate_kbps': round(recv_diff * 8 / 1024 / 10, 2)
+            'sent_rate_kbps': round(sent_diff * 8 / 1024 / dt, 2),
+            'recv_rate_kbps': round(recv_diff * 8 / 1024 / dt, 2)
         }
 
     def get_network_processes(self) -> list:
         """
         Получение списка процессов, использующих сеть
         """
+        now = time.monotonic()
+        if self._conn_cache_ts is not None and now - self._conn_cache_ts < CONN_CACHE_TTL:
+            return self._conn_cache
+
         processes = []
         try:
+            # Имя каждого процесса получаем один раз, даже если у него много соединений
+            names = {}
             for conn in psutil.net_connections(kind='inet'):
-                if conn.status == psutil.CONN_ESTABLISHED and conn.pid:
-                    try:
-                        p = psutil.Process(conn.pid)
-                        processes.append({
-                            'pid': conn.pid,
-                            'name': p.name(),
-                            'local_address': f"{conn.laddr.ip}:{conn.laddr.port}",
-                            'remote_address': f"{conn.raddr.ip}:{conn.raddr.port}" if conn.raddr else 'N/A',
-                            'status': conn.status
-                        })
-                    except (psutil.NoSuchProcess, psutil.AccessDenied):
-                        continue
+                if conn.status != psutil.CONN_ESTABLISHED or not conn.pid:
+                    continue
+                if conn.pid not in names:
+                    names[conn.pid] = self._get_process_name(conn.pid)
+                if names[conn.pid] is None:
+                    continue
+                processes.append({
+                    'pid': conn.pid,
+                    'name': names[conn.pid],
+                    'local_address': f"{conn.laddr.ip}:{conn.laddr.port}",
+                    'remote_address': f"{conn.raddr.ip}:{conn.raddr.port}" if conn.raddr else 'N/A',
+                    'status': conn.status
+                })
+                if len(processes) >= MAX_PROCESSES:  # Ограничиваем вывод
+                    break
         except Exception as e:
             self.logger.error(f"Process scan error: {e}")
-            
-        return processes[:20]  # Ограничиваем вывод
+            return processes
+
+        self._conn_cache = processes
+        self._conn_cache_ts = now
+        return processes
+
+    def _get_process_name(self, pid: int) -> Optional[str]:
+        """Имя процесса или None, если процесс завершился или недоступен"""
+        try:
+            p = psutil.Process(pid)
+            with p.oneshot():
+                return p.name()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return None
+
+    def refresh_external_info(self):
+        """
+        Обновление внешнего IP и провайдера не чаще раза в EXTERNAL_INFO_TTL,
+        и только пока интернет доступен; после ошибки повтор через EXTERNAL_INFO_RETRY
+        """
+        if not self._last_available:
+            return
+        now = time.monotonic()
+        if self._external_info_due is not None and now < self._external_info_due:
+            return
+        if self._update_external_info():
+            self._external_info_due = now + EXTERNAL_INFO_TTL
+        else:
+            self._external_info_due = now + EXTERNAL_INFO_RETRY
 
-    def _update_external_info(self):
-        """Обновление внешнего IP и информации о провайдере"""
+    def _update_external_info(self) -> bool:
+        """Обновление внешнего IP и информации о провайдере; при ошибке остаются прежние значения"""
         try:
             # Получаем внешний IP
-            ip_response = requests.get('https://api.ipify.org?format=json', timeout=5)
-            self.external_ip = ip_response.json().get('ip', 'N/A')
+            ip_response = self.session.get('https://api.ipify.org?format=json', timeout=EXTERNAL_INFO_TIMEOUT)
+            ip_response.raise_for_status()
+            external_ip = ip_response.json().get('ip')
+            if not external_ip:
+                return False
+            provider = self.provider if external_ip == self.external_ip else 'N/A'
             
             # Получаем информацию о провайдере (используем ip-api.com)
-            if self.external_ip != 'N/A':
-                provider_response = requests.get(f'http://ip-api.com/json/{self.external_ip}?fields=isp,org', timeout=5)
-                if provider_response.status_code == 200:
-                    data = provider_response.json()
-                    self.provider = data.get('isp', data.get('org', 'N/A'))
+            provider_response = self.session.get(f'http://ip-api.com/json/{external_ip}?fields=isp,org', timeout=EXTERNAL_INFO_TIMEOUT)
+            if provider_response.status_code == 200:
+                data = provider_response.json()
+                provider = data.get('isp', data.get('org', provider))
+
+            self.external_ip = external_ip
+            self.provider = provider
+            return True
         except Exception as e:
             self.logger.error(f"External info update failed: {e}")
+            return False
+
+    def _collect(self, future, default, name: str, timeout=COLLECT_TIMEOUT):
+        """Получение результата сборщика с ограничением по времени"""
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self.logger.error(f"{name} timed out after {timeout}s")
+        except Exception as e:
+            self.logger.error(f"{name} failed: {e}")
+        return default
 
     def get_all_stats(self) -> Dict[str, Any]:
         """
         Основной метод для сбора всех статистик
         """
-        availability = self.check_internet_availability()
-        
-        # Запускаем speedtest в отдельном потоке, если интернет доступен
-        speed_result = {'download': None, 'upload': None}
-        if availability['available']:
-            speed_thread = threading.Thread(
-                target=lambda: speed_result.update(self.measure_speed())
+        # Независимые сборщики запускаем параллельно
+        availability_future = _executor.submit(self.check_internet_availability)
+        network_future = _executor.submit(self.get_network_info)
+        traffic_future = _executor.submit(self.get_traffic_usage)
+        processes_future = _executor.submit(self.get_network_processes)
+
+        availability = self._collect(
+            availability_future,
+            {'available': False, 'status_code': 0, 'ping': None, 'test_url': None},
+            'Availability check'
+        )
+
+        # Speedtest запускаем не чаще раза в SPEEDTEST_INTERVAL, иначе берём последний замер
+        if availability['available'] and self._speedtest_due():
+            self._collect(
+                _executor.submit(self.run_speedtest), None,
+                'Speedtest', timeout=SPEEDTEST_TIMEOUT
             )
-            speed_thread.daemon = True
-            speed_thread.start()
-            speed_thread.join(timeout=8)  # Ждем максимум 8 секунд
+        speed_result = dict(self.last_speed)
         
         # Формируем полный ответ
         stats = {
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'timestamp': time.strftime(TIMESTAMP_FORMAT),
             'availability': availability,
             'speed': speed_result,
-            'network_info': self.get_network_info(),
-            'traffic': self.get_traffic_usage(),
-            'processes': self.get_network_processes(),
-            'last_down': self.last_down_time.strftime('%Y-%m-%d %H:%M:%S') if self.last_down_time else 'Never'
+            'network_info': self._collect(network_future, {}, 'Network info'),
+            'traffic': self._collect(traffic_future, {}, 'Traffic usage'),
+            'processes': self._collect(processes_future, [], 'Process scan'),
+            'last_down': self.last_down_text
         }
         
         # Сбрасываем время последнего падения, если интернет восстановился
@@ -216,5 +481,9 @@ class InternetMonitor:
             downtime = datetime.now() - self.last_down_time
             self.logger.info(f"INTERNET RESTORED after {downtime}")
             self.last_down_time = None
+            self.last_down_text = 'Never'
+            # После восстановления внешний IP мог смениться
+            self._external_info_due = None
+        self._last_available = availability['available']
             
         return stats
\ No newline at end of file